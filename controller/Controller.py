@@ -1,13 +1,16 @@
 import os.path
+from datetime import date, timedelta
 from dataclasses import asdict, fields, is_dataclass
 from typing import List, Any, Type
 
 import models
 from database.queries import CRUD
+from database.writebehind import WriteBehindQueue
 from database.models import *
 from utils.logs import Data_Logger_history as Logger
 from utils.errors import *
-from config import EXPORT_TYPE, EXPORT_DIR_NAME
+from utils.exports import EXPORT_SUFFIX
+from config import EXPORT_TYPE, EXPORT_DIR_NAME, ARCHIVE_AFTER_DAYS, WRITE_BEHIND
 
 
 def check_tablename(tablename: str):
@@ -17,8 +20,13 @@ def check_tablename(tablename: str):
 
 
 class Controller:
-    def __init__(self, tablename: str):
-        self.crud = CRUD()
+    def __init__(self, tablename: str, database_url: str = None, write_behind: bool = None, crud: CRUD = None):
+        # 传入 crud 时多个 Controller 共用同一个 engine / 连接池
+        self.crud = crud if crud is not None else CRUD(database_url)
+        if write_behind is None:
+            write_behind = WRITE_BEHIND
+        # 开启写回缓冲时 update/delete 先进入队列，由后台线程批量写入
+        self.write_queue = WriteBehindQueue(self.crud) if write_behind else None
         self.tablename = tablename
         self.dataclass_type = None
         self.data_fields = None
@@ -58,7 +66,8 @@ class Controller:
 
     def generate_id(self, table_name: str) -> int:
         first_id = models.first_table_dict[table_name]
-        size = self.crud.read_info(table_name)
+        # 生成主键必须读主库，副本可能还没有同步到最新的行
+        size = self.crud.read_info(table_name, use_primary=True)
         return first_id + size
 
     def clean_data(self, data: Any):
@@ -88,6 +97,8 @@ class Controller:
     def add_instance(self, data: Any) -> None:
         if self.status is not True:
             raise TableNameError(KeyError(), self.tablename, Logger)
+        # 先写入排队中的修改，保证 id 生成和插入顺序正确
+        self.flush()
         if 'id' in self.data_fields:
             data.id = self.generate_id(self.tablename)
 
@@ -104,16 +115,19 @@ class Controller:
         for key in fileter.keys():
             if key not in self.data_fields:
                 raise TableKeyError(KeyError(), key, Logger)
-        self.crud.delete(self.tablename, fileter)
+        if self.write_queue is not None:
+            self.write_queue.delete(self.tablename, fileter)
+        else:
+            self.crud.delete(self.tablename, fileter)
         Logger.info(f"{__name__} | {self.tablename} Remove: [{fileter.keys()} : {fileter.values()}]")
 
-    def search_instance(self, fileter: dict):
+    def search_instance(self, fileter: dict, include_archive: bool = False):
         if self.status is not True:
             raise TableNameError(KeyError(), self.tablename, Logger)
         for key in fileter.keys():
             if key not in self.data_fields:
                 raise TableKeyError(KeyError(), key, Logger)
-        res = self.crud.read(self.tablename, fileter)
+        res = self.crud.read(self.tablename, fileter, include_archive=include_archive)
         return res
 
     def update_instance(self, fileter: dict, data: dict):
@@ -125,19 +139,58 @@ class Controller:
         for filter_keys in fileter.keys():
             if filter_keys not in self.data_fields:
                 raise TableKeyError(KeyError(), filter_keys, Logger)
-            if not self.crud.exists(self.tablename, {filter_keys: fileter[filter_keys]}):
-                error_info = str({filter_keys: fileter[filter_keys]}) + " in " + self.tablename + " can not be update"
-                raise TableKeyError(KeyError(), error_info, Logger)
+        # 写回模式下按 id 更新不做预检查，未命中的行由后台线程在 flush 时报错；
+        # 其他条件先写入排队中的修改，否则检查会看到旧数据
+        if self.write_queue is None or set(fileter) != {"id"}:
+            self.flush()
+            for filter_keys in fileter.keys():
+                if not self.crud.exists(self.tablename, {filter_keys: fileter[filter_keys]}, use_primary=True):
+                    error_info = str({filter_keys: fileter[filter_keys]}) + " in " + self.tablename + " can not be update"
+                    raise TableKeyError(KeyError(), error_info, Logger)
         for key in data.keys():
             if key not in self.data_fields:
                 error_keys.append(key)
             else:
                 update_info[key] = data[key]
 
-        self.crud.update(self.tablename, fileter, update_info)
+        if self.write_queue is not None:
+            self.write_queue.update(self.tablename, fileter, update_info)
+        else:
+            self.crud.update(self.tablename, fileter, update_info)
         if error_keys is not None and len(error_keys) > 0:
             raise TableKeyError(KeyError(), error_keys, Logger)
 
+    def flush(self):
+        """
+        Write every queued update/delete before returning (no-op without write-behind).
+        Call it before reads that must see this controller's own changes.
+        """
+        if self.write_queue is not None:
+            self.write_queue.flush()
+
+    def close(self):
+        if self.write_queue is not None:
+            self.write_queue.close()
+
+    def search_text(self, column: str, query: str, limit: int = 20, offset: int = 0):
+        """
+        Ranked partial-match search on an indexed text column (see ``text_index_columns``).
+        """
+        if self.status is not True:
+            raise TableNameError(KeyError(), self.tablename, Logger)
+        if column not in text_index_columns.get(self.tablename, []):
+            raise TableKeyError(KeyError(), column, Logger)
+        res = self.crud.search_text(self.tablename, column, query, limit, offset)
+        return [row._asdict() for row in res]
+
+    def rebuild_text_index(self) -> int:
+        if self.status is not True:
+            raise TableNameError(KeyError(), self.tablename, Logger)
+        if self.tablename not in text_index_columns:
+            raise TableKeyError(KeyError(), self.tablename, Logger)
+        self.flush()
+        return self.crud.rebuild_text_index(self.tablename)
+
     def read_data_info(self):
         if self.status is not True:
             raise TableNameError(KeyError(), self.tablename, Logger)
@@ -147,8 +200,9 @@ class Controller:
     def file_output(self):
         if not os.path.exists(EXPORT_DIR_NAME):
             os.makedirs(EXPORT_DIR_NAME, exist_ok=True)
-        if EXPORT_TYPE not in {"csv", "excel", "json", "txt"}:
+        if EXPORT_TYPE not in EXPORT_SUFFIX:
             raise TableExportError(ValueError(), EXPORT_TYPE, Logger)
+        self.flush()
         if EXPORT_TYPE == "csv":
             self.crud.export_to_csv(self.tablename)
         elif EXPORT_TYPE == "excel":
@@ -157,13 +211,64 @@ class Controller:
             self.crud.export_to_json(self.tablename)
         elif EXPORT_TYPE == "txt":
             self.crud.export_to_txt(self.tablename)
+        elif EXPORT_TYPE == "parquet":
+            self.crud.export_to_parquet(self.tablename)
+        elif EXPORT_TYPE == "feather":
+            self.crud.export_to_feather(self.tablename)
         else:
             raise TableExportError(ValueError(), EXPORT_TYPE, Logger)
 
-    def get_data(self):
-        data = self.crud.get_all(self.tablename)
+    def snapshot_output(self, export_type: str = None) -> str:
+        """
+        Export all tables from one consistent snapshot, return the snapshot directory.
+        """
+        if export_type is None:
+            export_type = EXPORT_TYPE
+        if export_type not in EXPORT_SUFFIX:
+            raise TableExportError(ValueError(), export_type, Logger)
+        # 导出和归档之前先写入排队中的修改
+        self.flush()
+        snapshot_dir = self.crud.export_snapshot(export_type)
+        Logger.info(f"{__name__} | Snapshot export: {snapshot_dir}")
+        return snapshot_dir
+
+    def archive_instances(self, cutoff: date = None) -> int:
+        """
+        Move rows older than ``cutoff`` (default: ARCHIVE_AFTER_DAYS ago) to the archive table.
+        """
+        if self.status is not True:
+            raise TableNameError(KeyError(), self.tablename, Logger)
+        if self.tablename not in archive_date_columns:
+            raise TableKeyError(KeyError(), self.tablename, Logger)
+        if cutoff is None:
+            cutoff = date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        self.flush()
+        moved = self.crud.archive(self.tablename, cutoff)
+        Logger.info(f"{__name__} | {self.tablename} Archive before {cutoff}: {moved}")
+        return moved
+
+    def get_data(self, include_archive: bool = False, columns: list = None, limit: int = None, offset: int = 0):
+        """
+        Rows of the current table; archived history is only read when ``include_archive`` is set.
+        ``columns`` limits the returned fields, ``limit``/``offset`` page through the rows ordered by id.
+        """
+        data = self.crud.get_all(self.tablename, include_archive=include_archive,
+                                 columns=columns, limit=limit, offset=offset)
         return [row._asdict() for row in data]
 
+    def get_assignment_details(self, columns: list = None, limit: int = None, offset: int = 0):
+        """
+        Assignments with ``student_name`` and ``room_number`` instead of bare ids.
+        """
+        data = self.crud.get_assignment_details(columns=columns, limit=limit, offset=offset)
+        return [row._asdict() for row in data]
+
+    def get_room_occupants(self, columns: list = None, limit: int = None, offset: int = 0):
+        """
+        Rooms, each with the students currently living there under ``current_students``.
+        """
+        return self.crud.get_room_occupants(columns=columns, limit=limit, offset=offset)
+
     def get_fields(self):
         return self.data_fields
 
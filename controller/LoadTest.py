@@ -0,0 +1,324 @@
+import argparse
+import json
+import os.path
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import Pool
+
+from controller.Controller import Controller
+from database.database import get_engine, check_and_create_tables
+from database.queries import CRUD
+from database.models import StudentData
+from utils.errors import TableOperationError
+from config import EXPORT_TYPE
+
+OPERATIONS = ("add", "search", "update", "delete", "export")
+DEFAULT_MIX = {"add": 4, "search": 3, "update": 2, "delete": 1, "export": 0}
+LOAD_TEST_ROOM_ID = 10000
+# MySQL 锁等待超时 / 死锁
+LOCK_ERROR_CODES = {1205, 1213}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def classify_error(e: Exception) -> str:
+    """
+    Sort a failed call into ``conflict`` (duplicate key, e.g. a generate_id collision),
+    ``lock_timeout`` (lock wait timeout, deadlock, sqlite busy) or ``error``.
+    """
+    cause = e.args[0] if isinstance(e, TableOperationError) and e.args else e
+    if isinstance(cause, IntegrityError):
+        return "conflict"
+    if isinstance(cause, OperationalError):
+        code = cause.orig.args[0] if cause.orig is not None and cause.orig.args else None
+        if code in LOCK_ERROR_CODES or "locked" in str(cause).lower():
+            return "lock_timeout"
+    return "error"
+
+
+def prepare_database(database_url: str):
+    check_and_create_tables(get_engine(database_url))
+    crud = CRUD(database_url)
+    if not crud.exists("rooms", {"id": LOAD_TEST_ROOM_ID}):
+        crud.create("rooms", {"id": LOAD_TEST_ROOM_ID, "room_number": "load-test", "capacity": 0, "occupants": 0})
+
+
+class PoolStats:
+    """
+    Connection pool counters fed by SQLAlchemy pool events while installed: engines whose pool
+    opened its first connection (so engine churn shows up), DBAPI connections opened and checkouts.
+    ``watch(engine)`` also records the peak number of connections checked out of that engine's pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._saturated = set()
+        self.engines = 0
+        self.connections = 0
+        self.checkouts = 0
+        self.pool_size = 0
+        self.max_checked_out = 0
+        self.max_overflow = 0
+
+    def install(self):
+        event.listen(Pool, "first_connect", self._on_first_connect)
+        event.listen(Pool, "connect", self._on_connect)
+        event.listen(Pool, "checkout", self._on_checkout)
+
+    def remove(self):
+        event.remove(Pool, "first_connect", self._on_first_connect)
+        event.remove(Pool, "connect", self._on_connect)
+        event.remove(Pool, "checkout", self._on_checkout)
+
+    def watch(self, engine):
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            # sqlite 内存库等使用的连接池没有固定大小
+            return
+        with self._lock:
+            self.pool_size = max(self.pool_size, pool.size())
+
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            checked_out = pool.checkedout()
+            with self._lock:
+                self.max_checked_out = max(self.max_checked_out, checked_out)
+                self.max_overflow = max(self.max_overflow, pool.overflow())
+                if checked_out >= pool.size():
+                    self._saturated.add(id(pool))
+
+        event.listen(pool, "checkout", on_checkout)
+
+    def _on_first_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.engines += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"engines": self.engines, "connections_opened": self.connections, "checkouts": self.checkouts,
+                    "pool_size": self.pool_size, "max_checked_out": self.max_checked_out,
+                    "max_overflow": self.max_overflow, "saturated_pools": len(self._saturated)}
+
+
+def run_client(client_id: int, database_url: str, mix: Dict[str, int], duration: float,
+               start_at: float, seed: int, export_dir: str,
+               pool_stats: PoolStats = None, shared_crud: CRUD = None) -> dict:
+    """
+    One simulated desk issuing operations drawn from ``mix`` until ``duration`` seconds have passed.
+    The desk uses ``shared_crud`` when given, otherwise its own Controller, engine and pool.
+    Without ``pool_stats`` (process mode) the client collects its own and returns them under "pool".
+    Exports go to a per-client directory under ``export_dir``, never to EXPORT_DIR_NAME.
+    """
+    client_export_dir = os.path.join(export_dir, f"client{client_id}")
+    os.makedirs(client_export_dir, exist_ok=True)
+    rnd = random.Random(seed + client_id)
+    operations = [op for op in OPERATIONS if mix.get(op, 0) > 0]
+    weights = [mix[op] for op in operations]
+    result = {
+        "latencies": {op: [] for op in OPERATIONS},
+        "errors": {op: 0 for op in OPERATIONS},
+        "conflicts": 0,
+        "lock_timeouts": 0,
+        "error_types": {},
+    }
+    # 进程内的任务依次执行，每个客户端单独安装监听器不会重复计数
+    own_stats = pool_stats is None
+    if own_stats:
+        pool_stats = PoolStats()
+        pool_stats.install()
+
+    controller = Controller("students", database_url, crud=shared_crud)
+    if shared_crud is None:
+        pool_stats.watch(controller.crud.engine)
+
+    own_ids = []
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        op = rnd.choices(operations, weights)[0]
+        if op in ("update", "delete") and not own_ids:
+            op = "add"
+        start = time.perf_counter()
+        try:
+            if op == "add":
+                data = StudentData(name=f"client{client_id}-{rnd.randrange(10 ** 6)}", room_id=LOAD_TEST_ROOM_ID)
+                controller.add_instance(data)
+                own_ids.append(data.id)
+            elif op == "search":
+                controller.search_text("name", f"client{client_id}")
+            elif op == "update":
+                controller.update_instance({"id": rnd.choice(own_ids)}, {"age": rnd.randrange(16, 30)})
+            elif op == "delete":
+                controller.delete_instance({"id": own_ids.pop(rnd.randrange(len(own_ids)))})
+            elif op == "export":
+                getattr(controller.crud, f"export_to_{EXPORT_TYPE}")(controller.tablename, client_export_dir)
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == "conflict":
+                result["conflicts"] += 1
+            elif kind == "lock_timeout":
+                result["lock_timeouts"] += 1
+            result["errors"][op] += 1
+            name = type(e).__name__
+            result["error_types"][name] = result["error_types"].get(name, 0) + 1
+            continue
+        result["latencies"][op].append((time.perf_counter() - start) * 1000)
+
+    if shared_crud is None:
+        controller.crud.engine.dispose()
+    if own_stats:
+        pool_stats.remove()
+        result["pool"] = pool_stats.as_dict()
+    return result
+
+
+def merge_pool_stats(stats: List[dict]) -> dict:
+    merged = {}
+    for key in ("engines", "connections_opened", "checkouts", "saturated_pools"):
+        merged[key] = sum(item[key] for item in stats)
+    for key in ("pool_size", "max_checked_out", "max_overflow"):
+        merged[key] = max((item[key] for item in stats), default=0)
+    return merged
+
+
+def build_report(results: List[dict], config: dict, elapsed: float, pool: dict) -> dict:
+    operations = {}
+    total_ok = 0
+    for op in OPERATIONS:
+        latencies = [value for res in results for value in res["latencies"][op]]
+        errors = sum(res["errors"][op] for res in results)
+        if not latencies and not errors:
+            continue
+        total_ok += len(latencies)
+        operations[op] = {
+            "count": len(latencies),
+            "errors": errors,
+            "throughput_per_s": len(latencies) / elapsed,
+            "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+        }
+    error_types = {}
+    for res in results:
+        for name, count in res["error_types"].items():
+            error_types[name] = error_types.get(name, 0) + count
+    return {
+        "config": config,
+        "elapsed_s": elapsed,
+        "total": {
+            "operations": total_ok,
+            "throughput_per_s": total_ok / elapsed,
+            "errors": sum(sum(res["errors"].values()) for res in results),
+            "conflicts": sum(res["conflicts"] for res in results),
+            "lock_timeouts": sum(res["lock_timeouts"] for res in results),
+            "error_types": error_types,
+        },
+        "operations": operations,
+        "pool": pool,
+    }
+
+
+def run_load_test(database_url: str, clients: int = 8, duration: float = 10.0, mix: Dict[str, int] = None,
+                  mode: str = "thread", seed: int = 0, shared_engine: bool = False) -> dict:
+    """
+    Run ``clients`` concurrent desks against ``database_url`` and return the report as a dict.
+    With ``shared_engine`` (thread mode only) all desks use one CRUD and so one connection pool,
+    which is how the pool can saturate; otherwise every desk creates its own engine.
+    """
+    if mix is None:
+        mix = DEFAULT_MIX
+    if mode not in ("thread", "process"):
+        raise ValueError(f"unsupported mode {mode}")
+    if shared_engine and mode != "thread":
+        raise ValueError("shared_engine requires thread mode")
+    prepare_database(database_url)
+
+    pool_stats = shared_crud = None
+    if mode == "thread":
+        pool_stats = PoolStats()
+        pool_stats.install()
+    if shared_engine:
+        shared_crud = CRUD(database_url)
+        pool_stats.watch(shared_crud.engine)
+
+    executor_type = ThreadPoolExecutor if mode == "thread" else ProcessPoolExecutor
+    export_dir = tempfile.mkdtemp(prefix="load_test_export_")
+    # 所有客户端在同一时刻开始，排除 Controller 初始化的时间
+    start_at = time.time() + 1.0 + 0.05 * clients
+    try:
+        with executor_type(max_workers=clients) as executor:
+            futures = [executor.submit(run_client, client_id, database_url, mix, duration, start_at, seed,
+                                       export_dir, pool_stats, shared_crud)
+                       for client_id in range(clients)]
+            results = [future.result() for future in futures]
+        # 实际耗时：客户端在截止时间之后才完成最后一个操作
+        elapsed = time.time() - start_at
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+        if shared_crud is not None:
+            shared_crud.engine.dispose()
+        if pool_stats is not None:
+            pool_stats.remove()
+    if pool_stats is not None:
+        pool = pool_stats.as_dict()
+    else:
+        pool = merge_pool_stats([res["pool"] for res in results])
+    config = {"database_url": database_url, "clients": clients, "duration_s": duration,
+              "mix": mix, "mode": mode, "seed": seed, "shared_engine": shared_engine}
+    return build_report(results, config, elapsed, pool)
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for item in text.split(","):
+        op, weight = item.split("=")
+        if op not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {op}")
+        mix[op] = int(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    # 用法: python -m controller.LoadTest --clients 16 --duration 30 --mix add=4,search=3,update=2,delete=1
+    parser = argparse.ArgumentParser(description="Concurrent load test for Controller / CRUD")
+    parser.add_argument("--database-url", default=None,
+                        help="defaults to a fresh sqlite file in a temporary directory")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shared-engine", action="store_true",
+                        help="thread mode: all clients share one engine and connection pool")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load_test.db')}"
+    report = run_load_test(url, args.clients, args.duration, args.mix, args.mode, args.seed, args.shared_engine)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -1,7 +1,7 @@
-from .models import Student, Admin, Room, Assignment, Base
+from .models import Student, Admin, Room, Assignment, AssignmentArchive, TextPosting, Base
 from .database import SessionLocal, init_database
 from queries import CRUD
 
 __all__ = ["init_database", "SessionLocal",
-           "Student", "Admin", "Room", "Assignment", "Base",
+           "Student", "Admin", "Room", "Assignment", "AssignmentArchive", "TextPosting", "Base",
            "CRUD"]
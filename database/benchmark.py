@@ -0,0 +1,56 @@
+import os.path
+import statistics
+import sys
+import tempfile
+import time
+
+from database.database import get_engine, check_and_create_tables
+from database.queries import CRUD
+
+
+def run_operation(name: str, func, rounds: int) -> dict:
+    latencies = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        func(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "operation": name,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def benchmark(database_url: str, rounds: int = 200) -> list:
+    """
+    Time the single-row CRUD calls the desk client issues, one call per round.
+    """
+    check_and_create_tables(get_engine(database_url))
+    crud = CRUD(database_url)
+    first_id = 900000
+    crud.delete("rooms", {"room_number": "benchmark"})
+
+    results = [
+        run_operation("create", lambda i: crud.create(
+            "rooms", {"id": first_id + i, "room_number": "benchmark", "capacity": 4, "occupants": 0}), rounds),
+        run_operation("read", lambda i: crud.read("rooms", {"id": first_id + i}), rounds),
+        run_operation("exists", lambda i: crud.exists("rooms", {"id": first_id + i}), rounds),
+        run_operation("update", lambda i: crud.update("rooms", {"id": first_id + i}, {"occupants": 1}), rounds),
+        run_operation("read_info", lambda i: crud.read_info("rooms"), rounds),
+        run_operation("delete", lambda i: crud.delete("rooms", {"id": first_id + i}), rounds),
+    ]
+    return results
+
+
+if __name__ == "__main__":
+    # 用法: python -m database.benchmark [database_url] [rounds]
+    if len(sys.argv) > 1:
+        url = sys.argv[1]
+    else:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"{'operation':<10} {'mean(ms)':>10} {'p50(ms)':>10} {'p95(ms)':>10}   {url}")
+    for item in benchmark(url, count):
+        print(f"{item['operation']:<10} {item['mean_ms']:>10.3f} {item['p50_ms']:>10.3f} {item['p95_ms']:>10.3f}")
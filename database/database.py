@@ -1,13 +1,33 @@
-from sqlalchemy import create_engine, inspect, text, MetaData
+import os.path
+import sqlite3
+
+from sqlalchemy import create_engine, inspect, text, MetaData, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.orm import sessionmaker
 from models import Base
-from config import BASE_DATABASE_URL, DATABASE_NAME, DATABASE_URL
+from config import BASE_DATABASE_URL, DATABASE_NAME, DATABASE_URL, SQLITE_PRAGMAS
+
+
+def is_sqlite(database_url) -> bool:
+    return make_url(database_url).get_backend_name() == "sqlite"
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for key, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {key}={value}")
+    cursor.close()
 
 
 def get_engine(database_url=None):
     if database_url is None:
         database_url = DATABASE_URL
+    if is_sqlite(database_url):
+        # 允许连接池中的连接跨线程使用，WAL 下读写互不阻塞
+        engine = create_engine(database_url, connect_args={"check_same_thread": False})
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        return engine
     return create_engine(database_url)
 
 
@@ -28,7 +48,33 @@ def init_database():
         print(f"An unexpected error occurred: {e}")
 
 
+def copy_sqlite_database(source_url: str, replica_path: str) -> str:
+    """
+    Copy the sqlite database at ``source_url`` to ``replica_path`` with sqlite's online backup API
+    and return the replica's URL. Unlike copying the file, the copy includes changes still in the
+    WAL file and is consistent while the source is being written.
+    """
+    if not is_sqlite(source_url):
+        raise ValueError(f"{source_url} is not a sqlite database")
+    os.makedirs(os.path.dirname(os.path.abspath(replica_path)), exist_ok=True)
+    source = sqlite3.connect(make_url(source_url).database)
+    replica = sqlite3.connect(replica_path)
+    try:
+        source.backup(replica)
+    finally:
+        replica.close()
+        source.close()
+    return f"sqlite:///{replica_path}"
+
+
 def create_database():
+    if is_sqlite(DATABASE_URL):
+        # sqlite 在首次连接时创建数据库文件，只需保证目录存在
+        database_path = make_url(DATABASE_URL).database
+        if database_path and database_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        print("Database created successfully!")
+        return
     try:
         # 连接到默认数据库（不指定具体数据库）
         default_engine = get_engine(BASE_DATABASE_URL)
@@ -46,7 +92,7 @@ def check_and_create_tables(engine):
     metadata.reflect(engine)
 
     # 手动定义表的创建顺序
-    table_creation_order = ['rooms', 'students', 'admins', 'assignments']
+    table_creation_order = ['rooms', 'students', 'admins', 'assignments', 'assignments_archive', 'text_postings']
 
     for table_name in table_creation_order:
         model = Base.metadata.tables[table_name]
@@ -57,6 +103,9 @@ def check_and_create_tables(engine):
                 drop_and_create_table(engine, model)
             else:
                 print(f"Table {table_name} is up to date.")
+                # 表结构只比较列，已有的表要单独补建模型中新增的索引
+                for index in model.indexes:
+                    index.create(engine, checkfirst=True)
         else:
             print(f"Table {table_name} is missing, creating.")
             model.create(engine)
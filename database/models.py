@@ -3,7 +3,7 @@ from typing import Optional, List, Dict, Any, Type, TypeVar
 from datetime import datetime
 from dataclasses import dataclass, fields
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
@@ -11,6 +11,10 @@ T = TypeVar('T')
 
 tables_list = ["students", "rooms", "admins", "assignments"]
 first_table_dict = {"students": 10000, "rooms": 10000, "admins": 0}
+# 建立 n-gram 倒排索引、支持模糊搜索的列
+text_index_columns: Dict[str, List[str]] = {"students": ["name"], "admins": ["name"]}
+# 按日期归档的表及其日期列，归档表名为 f"{tablename}_archive"
+archive_date_columns: Dict[str, str] = {"assignments": "assigned_date"}
 
 
 @dataclass
@@ -65,6 +69,8 @@ class Student(Base):
     room_id = Column(Integer, ForeignKey('rooms.id'))
     enrollment_date = Column(Date)
 
+    room = relationship("Room", back_populates="students")
+
 
 class Room(Base):
     __tablename__ = 'rooms'
@@ -74,6 +80,8 @@ class Room(Base):
     capacity = Column(Integer)
     occupants = Column(Integer)
 
+    students = relationship("Student", back_populates="room", lazy="selectin")
+
 
 class Admin(Base):
     __tablename__ = 'admins'
@@ -86,11 +94,46 @@ class Admin(Base):
 
 class Assignment(Base):
     __tablename__ = 'assignments'
+    # 归档后 sqlite 也不能复用已移走的 id
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     student_id = Column(Integer, ForeignKey('students.id'))
     room_id = Column(Integer, ForeignKey('rooms.id'))
-    assigned_date = Column(Date)
+    assigned_date = Column(Date, index=True)
+
+    student = relationship("Student", lazy="joined")
+    room = relationship("Room", lazy="joined")
+
+
+class AssignmentArchive(Base):
+    """
+    已归档的 assignments，保留原 id；不设外键，学生或宿舍删除后历史仍然可查
+    """
+    __tablename__ = 'assignments_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    student_id = Column(Integer)
+    room_id = Column(Integer)
+    assigned_date = Column(Date, index=True)
+
+
+class TextPosting(Base):
+    """
+    n-gram 倒排表：每行表示 table_name.column_name 中 id 为 row_id 的记录包含 gram
+    """
+    __tablename__ = 'text_postings'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(50), nullable=False)
+    column_name = Column(String(50), nullable=False)
+    gram = Column(String(8), nullable=False)
+    row_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_text_postings_gram', 'table_name', 'column_name', 'gram', 'row_id'),
+        Index('ix_text_postings_row', 'row_id', 'table_name', 'column_name'),
+    )
 
 
 def dict2dataclass(data: dict, dataclass_type: Type[Base]):
@@ -1,15 +1,25 @@
+import itertools
 import os.path
+import threading
+import time
 import pandas as pd
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
 from typing import Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import MetaData, Table, table
-from database.database import SessionLocal, get_engine
+from sqlalchemy import MetaData, Table, table, select, func, union_all
+from database.database import SessionLocal, get_engine, is_sqlite
+from database.search import TextIndex
 from sqlalchemy.exc import IntegrityError
 
-from utils.errors import TableOperationError, TableValueError, TableExportError
+from utils.errors import TableOperationError, TableValueError, TableExportError, TableKeyError
 from utils.logs import Data_Logger_history as Logger
-from config import EXPORT_DIR_NAME, EXPORT_TYPE
+from utils.exports import write_frame
+from models import tables_list, text_index_columns, archive_date_columns
+from config import EXPORT_DIR_NAME, EXPORT_TYPE, EXPORT_WORKERS, REPLICA_DATABASE_URLS, READ_YOUR_WRITES_WINDOW, \
+    ARCHIVE_BATCH_SIZE
 
 
 # 获取数据库会话
@@ -23,10 +33,40 @@ def get_db():
 
 # 通用的增删改查函数
 class CRUD:
-    def __init__(self):
-        self.engine = get_engine()
+    def __init__(self, database_url: str = None, replica_urls: list = None):
+        # 写操作走主库 self.engine，只读操作可以分发到副本
+        self.engine = get_engine(database_url)
+        if replica_urls is None:
+            # 只有使用默认主库时才沿用配置中的副本
+            replica_urls = REPLICA_DATABASE_URLS if database_url is None else []
+        self.replica_engines = [get_engine(url) for url in replica_urls]
+        self._replica_cycle = itertools.cycle(self.replica_engines)
+        self._replica_lock = threading.Lock()
+        self._last_write = {}
         self.metadata = MetaData()
         self.metadata.reflect(self.engine)
+        self.text_index = TextIndex(self.metadata)
+
+    def mark_write(self, table_name: str):
+        self._last_write[table_name] = time.monotonic()
+
+    def read_engine(self, *table_names: str, use_primary: bool = False):
+        """
+        Pick the engine for a read-only operation.
+        Reads go to the primary when asked to, when no replica is configured, or while any of
+        ``table_names`` (any table if none given) is inside the read-your-writes window.
+        """
+        if use_primary or not self.replica_engines:
+            return self.engine
+        now = time.monotonic()
+        if not table_names:
+            recent_writes = self._last_write.values()
+        else:
+            recent_writes = [self._last_write.get(table_name, float("-inf")) for table_name in table_names]
+        if any(now - last_write < READ_YOUR_WRITES_WINDOW for last_write in recent_writes):
+            return self.engine
+        with self._replica_lock:
+            return next(self._replica_cycle)
 
     def create(self, table_name: str, data: dict):
         selected_table = self.metadata.tables.get(table_name)
@@ -36,38 +76,72 @@ class CRUD:
         with self.engine.connect() as conn:
             try:
                 insert_stmt = selected_table.insert().values(data)
-                conn.execute(insert_stmt)
+                result = conn.execute(insert_stmt)
+                if self.text_index.is_indexed(table_name):
+                    row = dict(data, id=result.inserted_primary_key[0])
+                    self.text_index.index_rows(conn, table_name, [row])
                 conn.commit()
             except IntegrityError as e:
                 conn.rollback()
                 raise TableOperationError(e, f"Add Item {data}", Logger)
+        self.mark_write(table_name)
 
-    def read(self, table_name: str, filters: dict = None):
+    def read(self, table_name: str, filters: dict = None, use_primary: bool = False, include_archive: bool = False):
         table = self.metadata.tables.get(table_name)
         if table is None:
             raise TableValueError(ValueError(), f"Table {table_name} does not exist", Logger)
 
-        with self.engine.connect() as conn:
-            select_stmt = table.select()
+        sources = [table]
+        if include_archive:
+            sources.append(self.archive_table(table_name))
+        select_stmts = []
+        for source in sources:
+            select_stmt = source.select()
             if filters:
                 for key, value in filters.items():
-                    select_stmt = select_stmt.where(table.c[key] == value)
-            result = conn.execute(select_stmt)
+                    select_stmt = select_stmt.where(source.c[key] == value)
+            select_stmts.append(select_stmt)
+
+        with self.read_engine(table_name, use_primary=use_primary).connect() as conn:
+            result = conn.execute(union_all(*select_stmts) if len(select_stmts) > 1 else select_stmts[0])
             return result.fetchall()
 
+    def _execute_update(self, conn, table_name: str, filters: dict, data: dict):
+        table = self.metadata.tables[table_name]
+        indexed_columns = []
+        if self.text_index.is_indexed(table_name):
+            indexed_columns = [column for column in text_index_columns[table_name] if column in data]
+        if indexed_columns:
+            # 先取出受影响的 id，过滤条件可能正是被修改的列
+            row_ids = self.text_index.matching_ids(conn, table_name, filters)
+        update_stmt = table.update()
+        for key, value in filters.items():
+            update_stmt = update_stmt.where(table.c[key] == value)
+        update_stmt = update_stmt.values(data)
+        result = conn.execute(update_stmt)
+        if indexed_columns:
+            self.text_index.reindex_ids(conn, table_name, row_ids, indexed_columns)
+        return result
+
+    def _execute_delete(self, conn, table_name: str, filters: dict):
+        table = self.metadata.tables[table_name]
+        if self.text_index.is_indexed(table_name):
+            self.text_index.remove_rows(conn, table_name, self.text_index.matching_ids(conn, table_name, filters))
+        delete_stmt = table.delete()
+        for key, value in filters.items():
+            delete_stmt = delete_stmt.where(table.c[key] == value)
+        return conn.execute(delete_stmt)
+
     def update(self, table_name: str, filters: dict, data: dict):
         table = self.metadata.tables.get(table_name)
         if table is None:
             raise TableValueError(ValueError(), f"Table {table_name} does not exist", Logger)
 
         with self.engine.connect() as conn:
-            update_stmt = table.update()
-            for key, value in filters.items():
-                update_stmt = update_stmt.where(table.c[key] == value)
-            update_stmt = update_stmt.values(data)
-            result = conn.execute(update_stmt)
+            result = self._execute_update(conn, table_name, filters, data)
             conn.commit()
-            return result.rowcount
+        self.mark_write(table_name)
+        return result.rowcount
 
     def delete(self, table_name: str, filters: dict):
         table = self.metadata.tables.get(table_name)
@@ -75,80 +149,266 @@ class CRUD:
             raise TableValueError(ValueError(), f"Table {table_name} does not exist", Logger)
 
         with self.engine.connect() as conn:
-            delete_stmt = table.delete()
-            for key, value in filters.items():
-                delete_stmt = delete_stmt.where(table.c[key] == value)
-            result = conn.execute(delete_stmt)
+            result = self._execute_delete(conn, table_name, filters)
             conn.commit()
-            return result.rowcount
+        self.mark_write(table_name)
+        return result.rowcount
+
+    def apply_batch(self, operations: list) -> list:
+        """
+        Apply ``(op, table_name, filters, data)`` tuples, op being "update" or "delete",
+        in a single transaction. Returns the number of affected rows of each operation.
+        """
+        for op, table_name, _, _ in operations:
+            if table_name not in self.metadata.tables:
+                raise TableValueError(ValueError(), f"Table {table_name} does not exist", Logger)
+            if op not in ("update", "delete"):
+                raise TableOperationError(ValueError(), op, Logger)
+
+        rowcounts = []
+        with self.engine.begin() as conn:
+            for op, table_name, filters, data in operations:
+                if op == "update":
+                    rowcounts.append(self._execute_update(conn, table_name, filters, data).rowcount)
+                else:
+                    rowcounts.append(self._execute_delete(conn, table_name, filters).rowcount)
+        for table_name in {operation[1] for operation in operations}:
+            self.mark_write(table_name)
+        return rowcounts
 
-    def exists(self, table_name: str, filters: Dict[str, Any]) -> bool:
+    def exists(self, table_name: str, filters: Dict[str, Any], use_primary: bool = False) -> bool:
         table = self.metadata.tables.get(table_name)
         if table is None:
             raise TableValueError(ValueError(), f"Table {table_name} does not exist", Logger)
 
-        with self.engine.connect() as conn:
+        with self.read_engine(table_name, use_primary=use_primary).connect() as conn:
             select_stmt = table.select().limit(1)
             for key, value in filters.items():
                 select_stmt = select_stmt.where(table.c[key] == value)
             result = conn.execute(select_stmt)
             return result.fetchone() is not None
 
-    def read_info(self, table_name: str):
+    def read_info(self, table_name: str, use_primary: bool = False):
         select_dat = self.metadata.tables.get(table_name)
         if select_dat is None:
             raise TableValueError(ValueError(), f"Table {table_name} does not exist", Logger)
 
-        with self.engine.connect() as conn:
-            selected_table = select_dat.select()
-            result = conn.execute(selected_table)
-            count = result.rowcount
+        with self.read_engine(table_name, use_primary=use_primary).connect() as conn:
+            # sqlite 的 SELECT 不返回 rowcount，统一用 COUNT(*)
+            count_stmt = select(func.count()).select_from(select_dat)
+            count = conn.execute(count_stmt).scalar()
             return count
 
-    def export_to_excel(self, tablename: str):
-        filename = os.path.join(EXPORT_DIR_NAME, f"{tablename}.xlsx")
-        with pd.ExcelWriter(filename) as writer:
-            selected_table = self.metadata.tables[tablename]
-            query = selected_table.select()
-            df = pd.read_sql(query, self.engine)
-            df.to_excel(writer, sheet_name=tablename, index=False)
-            Logger.info(f"Export to Excel {filename}")
-
-    def export_to_csv(self, tablename: str):
-        filename = os.path.join(EXPORT_DIR_NAME, f"{tablename}.csv")
+    def _export_table(self, tablename: str, export_type: str, label: str, export_dir: str = None):
+        if export_dir is None:
+            export_dir = EXPORT_DIR_NAME
         selected_table = self.metadata.tables[tablename]
         query = selected_table.select()
-        df = pd.read_sql(query, self.engine)
-        df.to_csv(filename, index=False)
-        Logger.info(f"Export to CSV {filename}")
+        df = pd.read_sql(query, self.read_engine(tablename))
+        try:
+            filename = write_frame(df, export_dir, tablename, export_type)
+        except ImportError as e:
+            raise TableExportError(e, export_type, Logger)
+        Logger.info(f"Export to {label} {filename}")
 
-    def export_to_txt(self, tablename: str):
-        filename = os.path.join(EXPORT_DIR_NAME, f"{tablename}.txt")
-        selected_table = self.metadata.tables[tablename]
-        query = selected_table.select()
-        df = pd.read_sql(query, self.engine)
-        df.to_csv(filename, index=False, sep='\t')
-        Logger.info(f"Export to TXT {filename}")
+    def export_to_excel(self, tablename: str, export_dir: str = None):
+        self._export_table(tablename, "excel", "Excel", export_dir)
 
-    def export_to_json(self, tablename: str):
-        filename = os.path.join(EXPORT_DIR_NAME, f"{tablename}.json")
-        selected_table = self.metadata.tables[tablename]
-        query = selected_table.select()
-        df = pd.read_sql(query, self.engine)
-        df.to_json(filename, orient='records')
-        Logger.info(f"Export to JSON {filename}")
+    def export_to_csv(self, tablename: str, export_dir: str = None):
+        self._export_table(tablename, "csv", "CSV", export_dir)
+
+    def export_to_txt(self, tablename: str, export_dir: str = None):
+        self._export_table(tablename, "txt", "TXT", export_dir)
+
+    def export_to_json(self, tablename: str, export_dir: str = None):
+        self._export_table(tablename, "json", "JSON", export_dir)
+
+    def export_to_parquet(self, tablename: str, export_dir: str = None):
+        self._export_table(tablename, "parquet", "Parquet", export_dir)
+
+    def export_to_feather(self, tablename: str, export_dir: str = None):
+        self._export_table(tablename, "feather", "Feather", export_dir)
 
-    def get_all(self, table_name: str):
+    def snapshot_tables(self) -> list:
+        """
+        Data tables included in a snapshot: ``tables_list`` and their archive tables.
+        Internal tables such as the text index postings are derived data and are left out.
+        """
+        names = set(tables_list) | {f"{table_name}_archive" for table_name in archive_date_columns}
+        return [selected_table for selected_table in self.metadata.sorted_tables
+                if selected_table.name in names]
+
+    def export_snapshot(self, export_type: str, max_workers: int = EXPORT_WORKERS) -> str:
+        """
+        Export every table as of one point in time.
+        All tables are read inside a single REPEATABLE READ transaction (one WAL read
+        transaction on sqlite), then the files are written in parallel by a process pool
+        (openpyxl/pyarrow writing is CPU-bound).
+        """
+        # 精确到微秒；目录已存在时直接报错，避免两个快照的文件混在一起
+        snapshot_dir = os.path.join(EXPORT_DIR_NAME, f"snapshot_{datetime.now():%Y%m%d_%H%M%S_%f}")
+        try:
+            os.makedirs(snapshot_dir)
+        except FileExistsError as e:
+            raise TableExportError(e, f"{export_type} snapshot {snapshot_dir} already exists", Logger)
+
+        frames = {}
+        engine = self.read_engine()
+        with engine.connect() as conn:
+            if not is_sqlite(engine.url):
+                conn.execution_options(isolation_level="REPEATABLE READ")
+            with conn.begin():
+                if is_sqlite(engine.url):
+                    # pysqlite 不会为 SELECT 隐式开启事务，显式 BEGIN 才能让所有读取共享同一个 WAL 快照
+                    conn.exec_driver_sql("BEGIN")
+                for selected_table in self.snapshot_tables():
+                    frames[selected_table.name] = pd.read_sql(selected_table.select(), conn)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(write_frame, df, snapshot_dir, name, export_type): name
+                       for name, df in frames.items()}
+            for future in as_completed(futures):
+                try:
+                    filename = future.result()
+                except Exception as e:
+                    raise TableExportError(e, f"{export_type} snapshot {futures[future]}", Logger)
+                Logger.info(f"Export snapshot {filename}")
+        return snapshot_dir
+
+    def select_page(self, source, columns: list = None, limit: int = None, offset: int = 0):
+        """
+        Select ``columns`` (all if None) from a table or subquery; paging orders by ``id``.
+        """
+        if columns:
+            for column in columns:
+                if column not in source.c:
+                    raise TableKeyError(KeyError(), column, Logger)
+            select_stmt = select(*[source.c[column] for column in columns])
+        else:
+            select_stmt = select(source)
+        if limit is not None or offset:
+            select_stmt = select_stmt.order_by(source.c.id).limit(limit).offset(offset)
+        return select_stmt
+
+    def get_all(self, table_name: str, include_archive: bool = False, columns: list = None,
+                limit: int = None, offset: int = 0):
         if table_name not in self.metadata.tables:
             raise TableValueError(ValueError(), f"Table {table_name} does not exist", Logger)
-        session = SessionLocal()
-        selected_table = self.metadata.tables.get(table_name)
-        try:
-            res = session.query(selected_table).all()
-            session.commit()
-            return res
-        except Exception as e:
-            session.rollback()
-            raise TableOperationError(e, "access data", Logger)
-        finally:
-            session.close()
\ No newline at end of file
+        source = self.metadata.tables.get(table_name)
+        if include_archive:
+            source = union_all(source.select(), self.archive_table(table_name).select()).subquery()
+        select_stmt = self.select_page(source, columns, limit, offset)
+        # 使用本实例的 engine，而不是绑定默认数据库的 SessionLocal
+        with self.read_engine(table_name).connect() as conn:
+            try:
+                return conn.execute(select_stmt).fetchall()
+            except Exception as e:
+                conn.rollback()
+                raise TableOperationError(e, "access data", Logger)
+
+    def get_assignment_details(self, columns: list = None, limit: int = None, offset: int = 0):
+        """
+        Assignments with the student name and room number, resolved by one LEFT JOIN.
+        """
+        assignments = self.metadata.tables["assignments"]
+        students = self.metadata.tables["students"]
+        rooms = self.metadata.tables["rooms"]
+        source = (select(assignments.c.id, assignments.c.student_id, students.c.name.label("student_name"),
+                         assignments.c.room_id, rooms.c.room_number, assignments.c.assigned_date)
+                  .select_from(assignments
+                               .outerjoin(students, assignments.c.student_id == students.c.id)
+                               .outerjoin(rooms, assignments.c.room_id == rooms.c.id))
+                  .subquery("assignment_details"))
+        select_stmt = self.select_page(source, columns, limit, offset)
+        with self.read_engine("assignments", "students", "rooms").connect() as conn:
+            return conn.execute(select_stmt).fetchall()
+
+    def get_room_occupants(self, columns: list = None, limit: int = None, offset: int = 0) -> list:
+        """
+        Rooms with their current students under ``current_students``.
+        Students of the whole page are loaded by one ``room_id IN (...)`` query instead of one query per room.
+        """
+        rooms = self.metadata.tables["rooms"]
+        students = self.metadata.tables["students"]
+        # 只查询需要的列，另外带上 id 用来关联学生
+        select_columns = columns
+        if columns and "id" not in columns:
+            select_columns = ["id"] + list(columns)
+        select_rooms = self.select_page(rooms, select_columns, limit, offset)
+
+        with self.read_engine("rooms", "students").connect() as conn:
+            room_rows = conn.execute(select_rooms).fetchall()
+            occupants = {row.id: [] for row in room_rows}
+            if occupants:
+                select_students = (select(students.c.id, students.c.name, students.c.room_id)
+                                   .where(students.c.room_id.in_(list(occupants)))
+                                   .order_by(students.c.id))
+                for student in conn.execute(select_students):
+                    occupants[student.room_id].append({"id": student.id, "name": student.name})
+
+        res = []
+        for row in room_rows:
+            room = row._asdict()
+            if columns and "id" not in columns:
+                del room["id"]
+            room["current_students"] = occupants[row.id]
+            res.append(room)
+        return res
+
+    def search_text(self, table_name: str, column: str, query: str, limit: int = 20, offset: int = 0):
+        """
+        Ranked substring search on an indexed text column, see ``database.search``.
+        """
+        table = self.metadata.tables.get(table_name)
+        if table is None or not self.text_index.is_indexed(table_name):
+            raise TableValueError(ValueError(), f"Table {table_name} has no text index", Logger)
+
+        with self.read_engine(table_name).connect() as conn:
+            ranked = self.text_index.search(conn, table_name, column, query, limit, offset)
+            if not ranked:
+                return []
+            rows = conn.execute(table.select().where(table.c.id.in_([row_id for row_id, _ in ranked])))
+            rows_by_id = {row.id: row for row in rows}
+        return [rows_by_id[row_id] for row_id, _ in ranked if row_id in rows_by_id]
+
+    def rebuild_text_index(self, table_name: str) -> int:
+        if not self.text_index.is_indexed(table_name):
+            raise TableValueError(ValueError(), f"Table {table_name} has no text index", Logger)
+
+        with self.engine.begin() as conn:
+            count = self.text_index.rebuild(conn, table_name)
+        self.mark_write(table_name)
+        Logger.info(f"Rebuild text index {table_name}: {count} rows")
+        return count
+
+    def archive_table(self, table_name: str):
+        archive = self.metadata.tables.get(f"{table_name}_archive")
+        if table_name not in archive_date_columns or archive is None:
+            raise TableValueError(ValueError(), f"Table {table_name} has no archive table", Logger)
+        return archive
+
+    def archive(self, table_name: str, cutoff, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+        """
+        Move rows whose date column is earlier than ``cutoff`` into the archive table.
+        Each batch of at most ``batch_size`` rows is copied and deleted in its own transaction.
+        """
+        table = self.metadata.tables.get(table_name)
+        archive = self.archive_table(table_name)
+        date_column = table.c[archive_date_columns[table_name]]
+        columns = [column.name for column in archive.columns]
+
+        moved = 0
+        while True:
+            with self.engine.begin() as conn:
+                select_ids = select(table.c.id).where(date_column < cutoff).order_by(table.c.id).limit(batch_size)
+                row_ids = [row.id for row in conn.execute(select_ids)]
+                if not row_ids:
+                    break
+                select_rows = select(*[table.c[column] for column in columns]).where(table.c.id.in_(row_ids))
+                conn.execute(archive.insert().from_select(columns, select_rows))
+                conn.execute(table.delete().where(table.c.id.in_(row_ids)))
+            moved += len(row_ids)
+        self.mark_write(table_name)
+        self.mark_write(archive.name)
+        Logger.info(f"Archive {table_name} before {cutoff}: {moved} rows")
+        return moved
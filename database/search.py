@@ -0,0 +1,135 @@
+import re
+
+from sqlalchemy import MetaData, select, func
+
+from models import text_index_columns
+
+POSTINGS_TABLE = "text_postings"
+
+# 中日韩文字按字切分，其余文字按单词切分
+_CJK_PATTERN = r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]"
+_TOKEN_RE = re.compile(rf"{_CJK_PATTERN}+|[^\W_]+")
+_CJK_RE = re.compile(_CJK_PATTERN)
+
+
+def _tokens(text: str):
+    return _TOKEN_RE.findall(str(text).casefold())
+
+
+def query_grams(text: str) -> set:
+    """
+    Grams that must be looked up for ``text``: bigrams of every token,
+    or the token itself when it is a single character.
+    """
+    grams = set()
+    for token in _tokens(text):
+        if len(token) == 1:
+            grams.add(token)
+        else:
+            grams.update(token[i:i + 2] for i in range(len(token) - 1))
+    return grams
+
+
+def index_grams(text: str) -> set:
+    """
+    Grams stored for ``text``. CJK characters are also indexed on their own so
+    that a one-character query (e.g. a surname) can be answered from the index.
+    Other words also store their first letter, so a one-letter query such as
+    "j" matches words starting with it ("John"), not words merely containing it.
+    """
+    grams = query_grams(text)
+    for token in _tokens(text):
+        if _CJK_RE.match(token):
+            grams.update(token)
+        else:
+            grams.add(token[0])
+    return grams
+
+
+class TextIndex:
+    """
+    Maintain and query the n-gram postings table for ``text_index_columns``.
+    Every method takes the caller's connection so that index changes commit together with the row.
+    """
+
+    def __init__(self, metadata: MetaData):
+        self.metadata = metadata
+        self.postings = metadata.tables.get(POSTINGS_TABLE)
+
+    def is_indexed(self, table_name: str) -> bool:
+        return self.postings is not None and table_name in text_index_columns
+
+    def matching_ids(self, conn, table_name: str, filters: dict) -> list:
+        table = self.metadata.tables[table_name]
+        select_stmt = select(table.c.id)
+        for key, value in filters.items():
+            select_stmt = select_stmt.where(table.c[key] == value)
+        return [row.id for row in conn.execute(select_stmt)]
+
+    def index_rows(self, conn, table_name: str, rows: list, columns: list = None):
+        if columns is None:
+            columns = text_index_columns[table_name]
+        postings = []
+        for row in rows:
+            for column in columns:
+                value = row.get(column)
+                if value is None:
+                    continue
+                postings.extend({"table_name": table_name, "column_name": column, "gram": gram, "row_id": row["id"]}
+                                for gram in index_grams(value))
+        if postings:
+            conn.execute(self.postings.insert(), postings)
+
+    def remove_rows(self, conn, table_name: str, row_ids: list, columns: list = None):
+        if not row_ids:
+            return
+        delete_stmt = self.postings.delete().where(self.postings.c.table_name == table_name,
+                                                   self.postings.c.row_id.in_(row_ids))
+        if columns is not None:
+            delete_stmt = delete_stmt.where(self.postings.c.column_name.in_(columns))
+        conn.execute(delete_stmt)
+
+    def reindex_ids(self, conn, table_name: str, row_ids: list, columns: list = None):
+        if columns is None:
+            columns = text_index_columns[table_name]
+        self.remove_rows(conn, table_name, row_ids, columns)
+        if not row_ids:
+            return
+        table = self.metadata.tables[table_name]
+        select_stmt = select(table.c.id, *[table.c[column] for column in columns]).where(table.c.id.in_(row_ids))
+        rows = [row._asdict() for row in conn.execute(select_stmt)]
+        self.index_rows(conn, table_name, rows, columns)
+
+    def rebuild(self, conn, table_name: str, batch_size: int = 5000) -> int:
+        columns = text_index_columns[table_name]
+        table = self.metadata.tables[table_name]
+        conn.execute(self.postings.delete().where(self.postings.c.table_name == table_name))
+        count = 0
+        last_id = None
+        while True:
+            select_stmt = select(table.c.id, *[table.c[column] for column in columns]).order_by(table.c.id)
+            if last_id is not None:
+                select_stmt = select_stmt.where(table.c.id > last_id)
+            rows = [row._asdict() for row in conn.execute(select_stmt.limit(batch_size))]
+            if not rows:
+                return count
+            self.index_rows(conn, table_name, rows, columns)
+            count += len(rows)
+            last_id = rows[-1]["id"]
+
+    def search(self, conn, table_name: str, column: str, query: str, limit: int = 20, offset: int = 0) -> list:
+        """
+        Return ``(row_id, score)`` ranked by the share of query grams a row contains.
+        """
+        grams = query_grams(query)
+        if not grams:
+            return []
+        hits = func.count().label("hits")
+        select_stmt = (select(self.postings.c.row_id, hits)
+                       .where(self.postings.c.table_name == table_name,
+                              self.postings.c.column_name == column,
+                              self.postings.c.gram.in_(grams))
+                       .group_by(self.postings.c.row_id)
+                       .order_by(hits.desc(), self.postings.c.row_id)
+                       .limit(limit).offset(offset))
+        return [(row.row_id, row.hits / len(grams)) for row in conn.execute(select_stmt)]
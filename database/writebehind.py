@@ -0,0 +1,153 @@
+import atexit
+import threading
+from collections import OrderedDict
+
+from utils.errors import TableOperationError
+from utils.logs import Data_Logger_history as Logger
+from config import WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL
+
+
+class WriteBehindQueue:
+    """
+    In-process queue of update/delete operations written to the database by a background thread.
+
+    Operations filtered by primary key alone (``{"id": ...}``) are coalesced per row: repeated
+    updates merge into one, and a delete replaces pending updates. Any other filter is kept as its
+    own entry and seals the earlier entries of that table, so merging never reorders writes.
+    A batch is written in one transaction once ``batch_size`` entries are pending or
+    ``flush_interval`` seconds have passed; ``flush()`` waits until everything queued so far is
+    written and raises the first write error, if any. An update by primary key that matches no row
+    is reported the same way, since the caller no longer checks the row exists before queuing it.
+    """
+
+    def __init__(self, crud, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL):
+        self.crud = crud
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # key -> [op, table_name, filters, data]
+        self._pending = OrderedDict()
+        self._epochs = {}
+        self._sequence = 0
+        self._enqueued = 0
+        self._written = 0
+        self._flush_requested = False
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        # 进程退出前把队列中的修改写入数据库
+        atexit.register(self.close)
+
+    def update(self, table_name: str, filters: dict, data: dict):
+        self._put("update", table_name, filters, data)
+
+    def delete(self, table_name: str, filters: dict):
+        self._put("delete", table_name, filters, None)
+
+    def _put(self, op: str, table_name: str, filters: dict, data):
+        with self._condition:
+            self._raise_error()
+            if self._closed:
+                raise TableOperationError(RuntimeError("write-behind queue is closed"), op, Logger)
+            epoch = self._epochs.get(table_name, 0)
+            if set(filters) == {"id"}:
+                key = (table_name, filters["id"], epoch)
+            else:
+                self._sequence += 1
+                key = (table_name, None, self._sequence)
+                self._epochs[table_name] = epoch + 1
+
+            # 已排队删除的行，之后的更新不会命中任何记录，直接丢弃
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [op, table_name, dict(filters), dict(data) if data else None]
+            elif entry[0] == "update" and op == "update":
+                entry[3].update(data)
+            elif op == "delete":
+                entry[0], entry[3] = "delete", None
+            self._enqueued += 1
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+
+    def flush(self, timeout: float = None):
+        """
+        Block until every operation queued before this call has been written.
+        """
+        with self._condition:
+            target = self._enqueued
+            self._flush_requested = True
+            self._condition.notify_all()
+            if not self._condition.wait_for(lambda: self._written >= target or not self._thread.is_alive(),
+                                            timeout):
+                raise TableOperationError(TimeoutError(), "write-behind flush", Logger)
+            self._raise_error()
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        with self._condition:
+            if self._error is not None:
+                Logger.error(f"write-behind closed with unwritten changes: {self._error}")
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise TableOperationError(error, "write-behind", Logger)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or self._flush_requested
+                                         or len(self._pending) >= self.batch_size,
+                                         self.flush_interval)
+                batch = list(self._pending.values())
+                self._pending.clear()
+                target = self._enqueued
+                self._flush_requested = False
+                closed = self._closed
+
+            if batch:
+                self._write(batch)
+            with self._condition:
+                self._written = target
+                self._condition.notify_all()
+            if closed:
+                return
+
+    def _set_error(self, error: Exception):
+        with self._condition:
+            if self._error is None:
+                self._error = error
+
+    def _check_rowcounts(self, batch: list, rowcounts: list):
+        for (op, table_name, filters, _), rowcount in zip(batch, rowcounts):
+            if op == "update" and set(filters) == {"id"} and rowcount == 0:
+                error_info = f"{filters} in {table_name} can not be update"
+                Logger.error(f"write-behind: {error_info}")
+                self._set_error(KeyError(error_info))
+
+    def _write(self, batch: list):
+        try:
+            self._check_rowcounts(batch, self.crud.apply_batch(batch))
+            Logger.info(f"write-behind: wrote {len(batch)} changes")
+            return
+        except Exception as e:
+            Logger.warning(f"write-behind: batch of {len(batch)} failed, retrying one by one | {e}")
+        # 整批失败时逐条重试，只丢弃真正出错的修改
+        for operation in batch:
+            try:
+                self._check_rowcounts([operation], self.crud.apply_batch([operation]))
+            except Exception as e:
+                Logger.error(f"write-behind: failed {operation} | {e}")
+                self._set_error(e)
@@ -0,0 +1,40 @@
+import os.path
+
+import pandas as pd
+
+from config import EXPORT_COMPRESSION
+
+# 导出格式与文件后缀
+EXPORT_SUFFIX = {
+    "csv": "csv",
+    "excel": "xlsx",
+    "json": "json",
+    "txt": "txt",
+    "parquet": "parquet",
+    "feather": "feather",
+}
+
+
+def write_frame(df: pd.DataFrame, export_dir: str, name: str, export_type: str) -> str:
+    """
+    Write one table to ``export_dir`` and return the file name.
+    Kept at module level (and free of database imports) so it can run in a worker process.
+    """
+    filename = os.path.join(export_dir, f"{name}.{EXPORT_SUFFIX[export_type]}")
+    if export_type == "csv":
+        df.to_csv(filename, index=False)
+    elif export_type == "excel":
+        with pd.ExcelWriter(filename) as writer:
+            df.to_excel(writer, sheet_name=name, index=False)
+    elif export_type == "json":
+        df.to_json(filename, orient='records')
+    elif export_type == "txt":
+        df.to_csv(filename, index=False, sep='\t')
+    elif export_type == "parquet":
+        # 列式格式依赖 pyarrow
+        df.to_parquet(filename, index=False, compression=EXPORT_COMPRESSION)
+    elif export_type == "feather":
+        df.to_feather(filename, compression=EXPORT_COMPRESSION)
+    else:
+        raise ValueError(f"unsupported export type {export_type}")
+    return filename
@@ -6,6 +6,7 @@ from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QVBoxLayout,
 from view.DataEntryDialog import DataEntryDialog
 from controller import Controller
 from database.models import *
+from config import VIEW_PAGE_SIZE
 
 
 class MainWindow(QMainWindow):
@@ -16,6 +17,13 @@ class MainWindow(QMainWindow):
 
         self.tabs = QTabWidget()
         self.table_widgets = {}
+        # 只读的关联视图：标签名 -> 读取函数
+        self.view_tabs = {
+            "assignment details": self.controller.get_assignment_details,
+            "room occupants": self.controller.get_room_occupants,
+        }
+        # 关联视图按页读取，记录每个标签页当前的 offset
+        self.view_offsets = {tab_name: 0 for tab_name in self.view_tabs}
 
         self.initUI()
 
@@ -27,6 +35,10 @@ class MainWindow(QMainWindow):
             tab = QWidget()
             self.init_tab(tab, tab_name)
             self.tabs.addTab(tab, tab_name)
+        for tab_name in self.view_tabs:
+            tab = QWidget()
+            self.init_view_tab(tab, tab_name)
+            self.tabs.addTab(tab, tab_name)
 
         self.setCentralWidget(self.tabs)
 
@@ -55,6 +67,10 @@ class MainWindow(QMainWindow):
         search_button.clicked.connect(lambda: self.export_data(tab_name))
         button_layout.addWidget(search_button)
 
+        snapshot_button = QPushButton('Export All')
+        snapshot_button.clicked.connect(self.export_all_data)
+        button_layout.addWidget(snapshot_button)
+
         hlayout = QHBoxLayout()
         hlayout.addLayout(layout)
         hlayout.addLayout(button_layout)
@@ -62,13 +78,47 @@ class MainWindow(QMainWindow):
         tab.setLayout(hlayout)
         self.load_data(tab_name)
 
+    def init_view_tab(self, tab, tab_name):
+        layout = QVBoxLayout()
+
+        table_widget = QTableWidget()
+        self.table_widgets[tab_name] = table_widget
+        layout.addWidget(table_widget)
+
+        button_layout = QHBoxLayout()
+        previous_button = QPushButton('Previous Page')
+        previous_button.clicked.connect(lambda: self.change_page(tab_name, -VIEW_PAGE_SIZE))
+        button_layout.addWidget(previous_button)
+
+        next_button = QPushButton('Next Page')
+        next_button.clicked.connect(lambda: self.change_page(tab_name, VIEW_PAGE_SIZE))
+        button_layout.addWidget(next_button)
+        layout.addLayout(button_layout)
+
+        tab.setLayout(layout)
+        self.load_data(tab_name)
+
+    def change_page(self, tab_name, step):
+        offset = self.view_offsets[tab_name] + step
+        if offset < 0:
+            return
+        # 已经是最后一页时不再翻页
+        if step > 0 and self.table_widgets[tab_name].rowCount() < VIEW_PAGE_SIZE:
+            return
+        self.view_offsets[tab_name] = offset
+        self.load_data(tab_name)
+
     def tab_changed(self):
         tab_name = self.tabs.tabText(self.tabs.currentIndex())
-        self.controller.change_tablename(self.tabs.tabText(self.tabs.currentIndex()))
+        if tab_name not in self.view_tabs:
+            self.controller.change_tablename(tab_name)
         self.load_data(tab_name)
 
     def load_data(self, tab_name):
-        data = self.controller.get_data()
+        if tab_name in self.view_tabs:
+            data = self.view_tabs[tab_name](limit=VIEW_PAGE_SIZE, offset=self.view_offsets[tab_name])
+        else:
+            data = self.controller.get_data()
         table_widget = self.table_widgets[tab_name]
         table_widget.setRowCount(len(data))
         table_widget.setColumnCount(len(data[0]) if data else 0)
@@ -76,6 +126,9 @@ class MainWindow(QMainWindow):
 
         for row_index, row_data in enumerate(data):
             for col_index, (key, value) in enumerate(row_data.items()):
+                if isinstance(value, list):
+                    # room occupants: 显示为 "id name" 列表
+                    value = ", ".join(f"{item['id']} {item['name']}" for item in value)
                 table_widget.setItem(row_index, col_index, QTableWidgetItem(str(value)))
 
     def add_data(self, tab_name):
@@ -92,6 +145,7 @@ class MainWindow(QMainWindow):
             data = dialog.get_data()
             dataclass_instance = dict2dataclass(data, tablename_datatype[tab_name])
             self.controller.update_instance(dataclass_instance)
+            self.controller.flush()
             self.load_data(tab_name)
 
     def delete_data(self, tab_name):
@@ -100,11 +154,15 @@ class MainWindow(QMainWindow):
             data = dialog.get_data()
             dataclass_instance = dict2dataclass(data, tablename_datatype[tab_name])
             self.controller.delete_instance(dataclass_instance)
+            self.controller.flush()
             self.load_data(tab_name)
 
     def export_data(self, tab_name):
         self.controller.file_output()
 
+    def export_all_data(self):
+        self.controller.snapshot_output()
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)